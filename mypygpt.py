@@ -12,15 +12,28 @@ as published by Sam Hocevar. See the LICENSE file or visit
 http://www.wtfpl.net/ for more details.
 """
 
+from asyncio import (
+    AbstractEventLoop,
+    Semaphore,
+    new_event_loop,
+    run_coroutine_threadsafe,
+    sleep,
+)
+from collections import deque
+from contextlib import contextmanager
 from datetime import datetime
 from dataclasses import dataclass
-from json import dump as json_dump, load as json_load
-from os import makedirs, path, remove as os_remove, rename as os_rename, startfile
-from platform import system as systemname
+from functools import cache
+from os import path, startfile
+from pathlib import Path
+from queue import Empty, Queue
 from subprocess import Popen
+from sys import platform as sysplatform
+from textwrap import wrap
 from random import choice
 from requests import get as requests_get, RequestException
-from re import DOTALL, match, sub
+from re import compile as re_compile, match
+from threading import Thread
 from tkinter import (
     BooleanVar,
     Button,
@@ -38,10 +51,24 @@ from tkinter import (
     Toplevel,
 )
 from tkinter.font import families, nametofont
-from tkinter.filedialog import askopenfilename, asksaveasfilename
-from tkinter.ttk import Combobox
 
-from openai import OpenAI, OpenAIError
+try:
+    # orjson is an optional dependency, but if it is installed, it is used to
+    # (de)serialize the sessions as it is considerably faster than json.
+    from orjson import OPT_APPEND_NEWLINE, dumps as json_dumps, loads as json_loads
+
+    def json_dumps_line(obj) -> bytes:
+        return json_dumps(obj, option=OPT_APPEND_NEWLINE)
+
+except ImportError:
+    from json import dumps, loads as json_loads
+
+    def json_dumps(obj) -> bytes:
+        return dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def json_dumps_line(obj) -> bytes:
+        return json_dumps(obj) + b"\n"
+
 
 try:
     # write your custom personalities into a personalities.py file next to the
@@ -80,6 +107,7 @@ except:
     }
 
 PERSONALITIES = PREDEFINED
+PERSONALITY_NAMES = tuple(PERSONALITIES)
 RANDOM = "<Random>"
 CONTINUE = "continue"
 SYSTEM_MESSAGE = (
@@ -103,6 +131,10 @@ SYSTEM_MESSAGE = (
     "exceptions for accented letters that are not available in ASCII but"
     "may be part of the language you are using or quoting."
 )  # I know that this is ugly and it is wrong, but it is what it is.
+# the main system message combined with each personality's prompt
+SYSTEM_MESSAGES = {
+    name: f"{SYSTEM_MESSAGE} {prompt}" for name, prompt in PERSONALITIES.items()
+}
 USER_NAME = "  __You"
 ASSISTANT_NAME = "MyPyGPT"
 SYSTEM_NAME = "SYS    "
@@ -118,6 +150,7 @@ ROLE_MAP = {
     SYSTEM: SYSTEM_NAME,
 }
 CONTENT = "content"
+NO_SPACE_BEFORE = frozenset(".,!?:;")  # continued messages starting with these
 PERSONALITY = "personality"
 FONT_PREFERENCE = [
     "Liberation Mono",
@@ -136,8 +169,28 @@ FONT_DEFAULT_PREFERENCE = [
     "Arial",
 ]
 SESSIONS_DIR = "sessions"
+SESSION_META_EXT = ".meta.json"  # settings of the session
+SESSION_HISTORY_EXT = ".jsonl"  # messages of the session, one per line
+SESSION_LEGACY_EXT = ".json"  # settings and messages in one file (older versions)
 ICONS_DIR = "icons"
+IS_WINDOWS = sysplatform.startswith("win")
+IS_DARWIN = sysplatform == "darwin"
 DEFAULT_CHATGPT_MODEL = "gpt-4o-mini"
+API_RETRIES = 3  # attempts for requests failing due to rate limits or connection
+API_RETRY_DELAY = 0.5  # seconds before the first retry, doubled for each retry
+STREAM_POLL_MS = 20  # how often the streamed response is checked for new text
+STREAM_START = "stream_start"  # chat display mark of the streamed response
+SAVE_DELAY_MS = 500  # consecutive saves within this time are merged into one
+VIEW_TOP = "view_top"  # chat display mark used to keep the view in place
+MAX_MOUNTED_MESSAGES = 200  # older messages are moved out of the chat display
+RESTORE_CHUNK = 20  # number of archived messages brought back at once
+# pattern used to clean up the responses (see `clean_up_response`)
+RE_CLEANUP = re_compile(
+    r"(?: *\n){2,}| +\n"  # empty lines and trailing spaces
+    r"|```(\w*)(?s:(.*?))```"  # code blocks
+    r"|(\*{1,2}|_{1,2})(.*?)\3"  # bold and italic
+    r"|`(.*?)`"  # inline code
+)
 VERSION = "0.6"
 LITE = False  # Set this to True if you want to force "lite mode".
 #               This will disable the ability to create and save sessions,
@@ -154,10 +207,38 @@ class Icons:
     DEFAULT = "default.ico"
 
 
+@cache
+def available_fonts() -> frozenset[str]:
+    """
+    Returns the font families available to Tk. The result is cached as the
+    lookup is a relatively expensive call into Tk and does not change while
+    the application is running. Requires an existing Tk root window.
+
+    Returns:
+        frozenset[str]: The available font families.
+    """
+    return frozenset(families())
+
+
+def write_file_safely(file_path: Path, data: bytes):
+    """
+    Writes a file through a temporary file that replaces it only once it is
+    complete, so a crash while writing does not leave a truncated file behind.
+
+    Args:
+        file_path (Path): The path of the file to write.
+        data (bytes): The new contents of the file.
+    """
+    temp_path = file_path.with_name(f"{file_path.name}.tmp")
+    temp_path.write_bytes(data)
+    temp_path.replace(file_path)
+
+
 class MyPyGPTClient(Tk):
     def __init__(self, lite_mode: bool = LITE):
         """My custom ChatGPT client."""
         super().__init__()
+        self.wm_withdraw()  # shown by `center_window` once it is laid out
 
         self.lite_mode = LITE or lite_mode
 
@@ -188,14 +269,41 @@ class MyPyGPTClient(Tk):
         )
 
         self.sessions_dir = SESSIONS_DIR
-        makedirs(self.sessions_dir, exist_ok=True)
+        self._sessions_path = Path(self.sessions_dir)
+        self._sessions_path.mkdir(parents=True, exist_ok=True)
+
+        self._openai_client = None
+        self._event_loop = None
+        self._api_semaphore = Semaphore(1)  # one request in flight at a time
+        self._stream_future = None
 
         self.current_session = None
         self.session_data = []
+        self._user_indices = []  # indices of the (non-continue) user entries
+        self._saved_session = None  # the session that was saved last
+        self._saved_meta = None  # the settings that were saved last
+        self._saved_entries = None  # number of entries already saved, if known
+        self._save_pending = None
+        self._api_messages = [{ROLE: SYSTEM, CONTENT: self.system_message}]
+        self._stream_queue = None
+        self._stream_buffer = []
+        self._stream_format = (None, False)
+        self._mounted_text = deque()  # messages currently in the chat display
+        self._archived_text = []  # older messages, the newest one being last
+        self._restore_pending = False
+        self._display_length = 0  # length of all displayed (incl. archived) text
+        self._user_text_starts = []  # where each displayed user message starts
+        self._write_depth = 0  # nesting level of `writable_chat`
+        self._scroll_pending = False
+        self._popup_cache = {}  # popup windows kept hidden between uses
 
         self.chat_frame = Frame(self)
         self.chat_display = Text(
-            self.chat_frame, state="disabled", wrap="word", font="TkFixedFont"
+            self.chat_frame,
+            state="disabled",
+            wrap="word",
+            font="TkFixedFont",
+            yscrollcommand=self._on_chat_scroll,
         )
 
         self.input_frame = Frame(self)
@@ -214,6 +322,9 @@ class MyPyGPTClient(Tk):
         self.send_button = Button(
             self.input_frame, text="Send", command=self.send_message
         )
+        self.stop_button = Button(
+            self.input_frame, text="Stop", command=self.stop_response
+        )
 
         self.button_frame = Frame(self)
         self.new_session_button = Button(
@@ -261,18 +372,45 @@ class MyPyGPTClient(Tk):
     def system_message(self) -> str:
         """
         Puts together the System message from the main `SYSTEM_MESSAGE`, the
-        selected personality and the additional system message that can be
-        defined for the session.
+        selected personality (see `SYSTEM_MESSAGES`) and the additional system
+        message that can be defined for the session.
 
         Returns:
             str: The combined system message.
         """
         asm = f" {self.add_sys_msg}" if self.add_sys_msg else ""
-        return (
-            f"{SYSTEM_MESSAGE} "
-            + PERSONALITIES[self.personality or list(PERSONALITIES.keys())[0]]
-            + asm
-        )
+        return SYSTEM_MESSAGES[self.personality or PERSONALITY_NAMES[0]] + asm
+
+    @property
+    def openai_client(self):
+        """
+        The asynchronous OpenAI client. It is only created (and `openai`
+        imported) on first use to keep the startup fast. Its own retries are
+        turned off, failed requests are retried by `create_completion`.
+
+        Returns:
+            AsyncOpenAI: The OpenAI client.
+        """
+        if self._openai_client is None:
+            from openai import AsyncOpenAI
+
+            self._openai_client = AsyncOpenAI(max_retries=0)
+        return self._openai_client
+
+    @property
+    def event_loop(self) -> AbstractEventLoop:
+        """
+        The asyncio event loop the requests to the OpenAI API run on. Tk has
+        to stay in the main thread, so the loop runs in a background thread
+        that is started on first use.
+
+        Returns:
+            AbstractEventLoop: The event loop.
+        """
+        if self._event_loop is None:
+            self._event_loop = new_event_loop()
+            Thread(target=self._event_loop.run_forever, daemon=True).start()
+        return self._event_loop
 
     def on_closing(self):
         """
@@ -280,6 +418,7 @@ class MyPyGPTClient(Tk):
         temporary session option is enabled, the application will be destroyed,
         otherwise it will ask for confirmation before quitting.
         """
+        self.flush_save()
         if self.current_session is None or not self.session_data or self.lite_mode:
             self.destroy()
             return
@@ -303,7 +442,7 @@ class MyPyGPTClient(Tk):
             str: The selected font.
         """
         for font in options:
-            if font in families():
+            if font in available_fonts():
                 return font
         return default
 
@@ -322,6 +461,7 @@ class MyPyGPTClient(Tk):
         self.edit_button.pack(side="right", padx=5)
         self.cont_button.pack(side="right")
         self.send_button.pack(side="right", padx=5)
+        self.stop_button.pack(side="right")
 
         self.button_frame.pack(padx=10, pady=10, fill="x")
         self.new_session_button.pack(side="left")
@@ -333,7 +473,7 @@ class MyPyGPTClient(Tk):
         self.temp_session_checkbox.pack(side="left")
 
     def add_space_when_needed(self, message: str) -> str:
-        return [" ", ""][message[0] in [".", ",", "!", "?", ":", ";"]] + message
+        return ("" if message[:1] in NO_SPACE_BEFORE else " ") + message
 
     def format_chat_message(
         self, message: str, sender: str | None, add_space: bool = False
@@ -368,25 +508,57 @@ class MyPyGPTClient(Tk):
             message = self.add_space_when_needed(message)
         return message
 
-    def get_response_from_chatgpt(self, message: str) -> str:
+    async def get_response_from_chatgpt(self, request: dict, stream_queue: Queue):
+        """
+        Sends a request to the OpenAI API and streams the response into the
+        given queue. This runs on `event_loop`, so it must not touch any
+        widgets.
+
+        Every received piece of text is put into the queue as a `str`. The end
+        of the response is marked by `None`, or by the exception itself if an
+        error occurred.
+
+        Args:
+            request (dict): The completion request (see `create_completion_request`).
+            stream_queue (Queue): The queue to put the response pieces into.
+        """
+        async with self._api_semaphore:
+            try:
+                # leaving the block closes the stream and its connection, also
+                # when the response is cancelled
+                async with await self.create_completion(request) as stream:
+                    async for chunk in stream:
+                        if chunk.choices and (text := chunk.choices[0].delta.content):
+                            stream_queue.put(text)
+                # NOTE: token counting?
+                stream_queue.put(None)
+            except Exception as e:
+                stream_queue.put(e)
+
+    async def create_completion(self, request: dict):
         """
-        Sends a message to the OpenAI API and returns the response.
+        Sends a streaming completion request to the OpenAI API. Requests that
+        fail due to rate limits or connection problems are retried up to
+        `API_RETRIES` times with an exponentially growing delay. This is the
+        only retry policy, as the client itself does not retry.
 
         Args:
-            message (str): The message to send.
+            request (dict): The completion request (see `create_completion_request`).
 
         Returns:
-            str: The response from the OpenAI API.
+            AsyncStream: The stream of the response chunks.
         """
-        try:
-            response = openai.chat.completions.create(
-                **self.create_completion_request(message, self.session_data)
-            )
-            # NOTE: token counting?
-            return response.choices[0].message.content.strip(), ASSISTANT
-        except Exception as e:
-            self.popup_info("Error", f"An error occurred: {e}", True)
-            return "Sorry, I couldn't process your request.", SYSTEM
+        from openai import APIConnectionError, RateLimitError
+
+        for attempt in range(API_RETRIES):
+            try:
+                return await self.openai_client.chat.completions.create(
+                    **request, stream=True
+                )
+            except (APIConnectionError, RateLimitError):
+                if attempt == API_RETRIES - 1:
+                    raise
+                await sleep(API_RETRY_DELAY * 2**attempt)
 
     def update_chat_display(
         self, message: str, sender: str | None = None, add_space: bool = False
@@ -399,49 +571,253 @@ class MyPyGPTClient(Tk):
             sender (str | None, optional): The sender of the message. Defaults to None.
             add_space (bool, optional): Whether to add a space before the message or not. Defaults to False.
         """
-        message = message.strip()
-        self.chat_display.configure(state="normal")
-        self.chat_display.insert(
-            "end", self.format_chat_message(message, sender, add_space)
-        )
-        self.chat_display.configure(state="disabled")
+        message = self.format_chat_message(message.strip(), sender, add_space)
+        self.display_formatted_messages([(message, sender)])
+
+    def display_formatted_messages(self, messages: list[tuple[str, str | None]]):
+        """
+        Appends already formatted messages to the chat display with a single
+        insert.
+
+        Messages that would be archived right away are never inserted into the
+        widget at all.
+
+        Args:
+            messages (list[tuple[str, str | None]]): The formatted messages and
+                their senders, in display order.
+        """
+        texts = []
+        for message, sender in messages:
+            if sender == USER_NAME:
+                self._user_text_starts.append(self._display_length)
+            self._display_length += len(message)
+            texts.append(message)
+
+        overflow = len(self._mounted_text) + len(texts) - MAX_MOUNTED_MESSAGES
+        with self.writable_chat():
+            if overflow > 0:
+                unmounted = [
+                    self._mounted_text.popleft()
+                    for _ in range(min(overflow, len(self._mounted_text)))
+                ]
+                if unmounted:
+                    length = sum(map(len, unmounted))
+                    self.chat_display.delete("1.0", f"1.0+{length}c")
+                self._archived_text.extend(unmounted)
+                self._archived_text.extend(texts[: overflow - len(unmounted)])
+                texts = texts[overflow - len(unmounted) :]
+            self.chat_display.insert("end", "".join(texts))
+            self._mounted_text.extend(texts)
+        self.scroll_chat_to_end()
+
+    @contextmanager
+    def writable_chat(self):
+        """
+        Makes the chat display editable for the duration of the `with` block.
+        Nested blocks only toggle the state of the widget at the outermost
+        level, so bursts of changes cost a single pair of state changes.
+        """
+        if not self._write_depth:
+            self.chat_display.configure(state="normal")
+        self._write_depth += 1
+        try:
+            yield
+        finally:
+            self._write_depth -= 1
+            if not self._write_depth:
+                self.chat_display.configure(state="disabled")
+
+    def scroll_chat_to_end(self):
+        """
+        Scrolls the chat display to its end once Tk becomes idle. Multiple
+        requests before that result in a single scroll.
+        """
+        if not self._scroll_pending:
+            self._scroll_pending = True
+            self.after_idle(self._scroll_chat_to_end)
+
+    def _scroll_chat_to_end(self):
+        self._scroll_pending = False
         self.chat_display.see("end")
 
+    def _on_chat_scroll(self, first: str, last: str):
+        """
+        `yscrollcommand` of the chat display. Schedules bringing back archived
+        messages when the view gets close to the top.
+
+        Args:
+            first (str): The fraction of the text above the view.
+            last (str): The fraction of the text above the bottom of the view.
+        """
+        if float(first) < 0.05 and self._archived_text and not self._restore_pending:
+            self._restore_pending = True
+            self.after_idle(self.restore_archived_text)
+
+    def restore_archived_text(self):
+        """
+        Puts the most recently archived messages back to the top of the chat
+        display while keeping the current view in place.
+        """
+        self._restore_pending = False
+        if not self._archived_text:
+            return
+        restored = self._archived_text[-RESTORE_CHUNK:]
+        del self._archived_text[-RESTORE_CHUNK:]
+        self._mounted_text.extendleft(reversed(restored))
+        self.chat_display.mark_set(VIEW_TOP, "@0,0")
+        with self.writable_chat():
+            self.chat_display.insert("1.0", "".join(restored))
+        self.chat_display.yview(VIEW_TOP)
+
+    def clean_up_response(self, response: str) -> str:
+        """
+        Removes empty lines, trailing spaces and the most common markdown
+        formatting from the response in a single pass.
+
+        Args:
+            response (str): The response to clean up.
+
+        Returns:
+            str: The cleaned up response.
+        """
+
+        def replace(m) -> str:
+            if m.group(1) is not None:
+                code = f"{m.group(1)}    {m.group(2)}".replace("\n", "\n    ")
+                return "\n" + "\n".join(line.rstrip() for line in code.split("\n"))
+            if m.group(3):
+                return m.group(4)
+            if m.group(5) is not None:
+                return m.group(5)
+            return "\n"
+
+        return RE_CLEANUP.sub(replace, response).strip()
+
     def get_and_update_response(
         self, message: str, sender: str | None = None, add_space: bool = False
     ):
         """
-        This function sends the message to the AI and updates the display with
-        the user input and the response.
+        This function sends the message to the AI and starts streaming the
+        response into the display. The response is finalized by
+        `finish_stream` once it has fully arrived.
 
         Args:
             message (str): User input.
             sender (str | None, optional): Name of sender. Defaults to None.
             add_space (bool, optional): Whether to add extra space (in case of a 'continue' message). Defaults to False.
         """
-        response, receiver = self.get_response_from_chatgpt(message)
-        response = sub(r"\n+", "\n", response).strip()
-        # remove most common markdown formatting
-        response = sub(
-            r"(\*{1,2}|_{1,2})(.*?)\1",
-            lambda m: m.group(2),
-            response,
-        )
-        response = sub(
-            r"```(\w*)(.*?)```",
-            lambda m: f"\n{m.group(1)}    {m.group(2).replace("\n", "\n    ")}",
-            response,
-            flags=DOTALL,
+        request = self.create_completion_request(message)
+        self._stream_queue = Queue()
+        self._stream_buffer = []
+        self._stream_format = (sender, add_space)
+        self.chat_display.mark_set(STREAM_START, "end-1c")
+        self.chat_display.mark_gravity(STREAM_START, "left")
+        self._stream_future = run_coroutine_threadsafe(
+            self.get_response_from_chatgpt(request, self._stream_queue),
+            self.event_loop,
         )
-        response = sub(r"`(.*?)`", lambda m: m.group(1), response)
-        response = sub(r" +\n", "\n", response)
-        self.session_data.append(
+        self.after(STREAM_POLL_MS, self._drain_stream_queue, self._stream_queue)
+
+    def stop_response(self, discard: bool = False):
+        """
+        Stops the response that is currently streaming. The part of the
+        response that has arrived so far is kept, unless it is discarded.
+
+        Args:
+            discard (bool, optional): Whether to drop the response without adding it to the session. Defaults to False.
+        """
+        if self._stream_queue is None:
+            return
+        self._stream_future.cancel()
+        if not discard:
+            self._stream_queue.put(None)
+            return
+        self._stream_queue = None
+        self._stream_future = None
+        self._stream_buffer = []
+        with self.writable_chat():
+            self.chat_display.delete(STREAM_START, "end-1c")
+
+    def _drain_stream_queue(self, stream_queue: Queue):
+        """
+        Moves the already received pieces of the streamed response into the
+        display and reschedules itself until the response is finished.
+
+        Args:
+            stream_queue (Queue): The queue of the response. Polling stops once
+                it is no longer the queue of the current response.
+        """
+        if stream_queue is not self._stream_queue:
+            return
+        with self.writable_chat():
+            try:
+                while True:
+                    item = stream_queue.get_nowait()
+                    if item is None or isinstance(item, Exception):
+                        break
+                    self._append_stream_token(item)
+            except Empty:
+                self.after(STREAM_POLL_MS, self._drain_stream_queue, stream_queue)
+                return
+        self.finish_stream(item)
+
+    def _append_stream_token(self, text: str):
+        """
+        Appends a piece of the streamed response to the chat display as is.
+
+        Args:
+            text (str): The received piece of the response.
+        """
+        if not self._stream_buffer:
+            text = text.lstrip()
+            if not text:
+                return
+            self._stream_buffer.append(text)
+            text = self.format_chat_message(text, *self._stream_format)
+        else:
+            self._stream_buffer.append(text)
+        with self.writable_chat():
+            self.chat_display.insert("end", text)
+        self.scroll_chat_to_end()
+
+    def finish_stream(self, error: Exception | None = None):
+        """
+        Cleans up the fully streamed response, replaces the raw streamed text
+        on the display with it and adds it to the session.
+
+        Args:
+            error (Exception | None, optional): The error that interrupted the response, if any. Defaults to None.
+        """
+        sender, add_space = self._stream_format
+        self._stream_queue = None
+        self._stream_future = None
+        if error is not None:
+            self.popup_info("Error", f"An error occurred: {error}", True)
+            response, receiver = "Sorry, I couldn't process your request.", SYSTEM
+        else:
+            response, receiver = "".join(self._stream_buffer).strip(), ASSISTANT
+        self._stream_buffer = []
+        with self.writable_chat():
+            self.chat_display.delete(STREAM_START, "end-1c")
+
+        if not response:
+            # stopped before anything arrived, a pending continue is dropped
+            # as there is nothing it could be merged into
+            last = self.session_data[-1] if self.session_data else None
+            if last and last[ROLE] == USER and last[CONTENT] == CONTINUE:
+                self.truncate_session(len(self.session_data) - 1)
+            self.schedule_save()
+            self.input_box.focus_set()
+            return
+
+        response = self.clean_up_response(response)
+        self.add_session_entry(
             {ROLE: receiver, CONTENT: response, PERSONALITY: self.personality}
         )
         if sender is None and receiver in [DEBUG_NAME, SYSTEM_NAME]:
             sender = receiver
         self.update_chat_display(response, sender, add_space)
-        self.save_current_session()
+        self.schedule_save()
         self.input_box.focus_set()
 
     def send_message(self):
@@ -452,6 +828,9 @@ class MyPyGPTClient(Tk):
         This is also responsible for starting a new session when needed and to
         update the session data with the new messages.
         """
+        if self._stream_queue is not None:
+            return
+
         message = self.input_box.get().strip()
         if not message or message == CONTINUE:
             self.continue_message()
@@ -464,7 +843,7 @@ class MyPyGPTClient(Tk):
                 self.delete_session(False, False, True)
         else:
             if self.current_session is None:
-                self.new_session(keep_session_data=self.session_data is not None)
+                self.new_session(keep_session_data=True)
 
         self.update_chat_display(message, USER_NAME)
         self.input_box.delete(0, "end")
@@ -472,17 +851,39 @@ class MyPyGPTClient(Tk):
         self.get_and_update_response(message, ASSISTANT_NAME)
 
     def delete_from_chat_end(self, chars: int = 0, all=False):
-        self.chat_display.configure(state="normal")
         if all:
-            self.chat_display.delete(1.0, "end")
+            self._mounted_text.clear()
+            self._archived_text.clear()
+            self._user_text_starts.clear()
+            self._display_length = 0
         else:
-            self.chat_display.delete(f"end-{chars}c", "end")
-        self.chat_display.configure(state="disabled")
+            self._display_length -= chars
+            while (
+                self._user_text_starts
+                and self._user_text_starts[-1] >= self._display_length
+            ):
+                self._user_text_starts.pop()
+            while self._archived_text and chars > sum(map(len, self._mounted_text)):
+                self.restore_archived_text()
+            remaining = chars
+            while remaining > 0 and self._mounted_text:
+                last = self._mounted_text.pop()
+                if len(last) > remaining:
+                    self._mounted_text.append(last[:-remaining])
+                remaining -= len(last)
+        with self.writable_chat():
+            if all:
+                self.chat_display.delete(1.0, "end")
+            else:
+                self.chat_display.delete(f"end-{chars + 1}c", "end-1c")
 
     def continue_message(self):
         """
         Continues the last assistant message if it exists.
         """
+        if self._stream_queue is not None:
+            return
+
         if not self.session_data:
             self.popup_info("Error", "No messages to continue.", True)
             return
@@ -507,56 +908,72 @@ class MyPyGPTClient(Tk):
         Args:
             undo (bool, optional): Whether to undo the last message. Defaults to False.
         """
+        if self._stream_queue is not None:
+            return
+
         if not self.session_data:
             self.popup_info("Error", "No messages to edit.", True)
             return
 
-        to_delete = 0
-        last_user_message = ""
-
-        sdl = len(self.session_data) - 1
-
-        for sd in range(sdl, -1, -1):
-            sender, content = (
-                self.session_data[sd][ROLE],
-                self.session_data.pop(sd)[CONTENT],
-            )
-            to_delete += len(self.format_chat_message(content, ROLE_MAP[sender]))
-            if ROLE_MAP[sender] == USER_NAME and content != CONTINUE:
-                last_user_message = content
-                break
-
-        if not last_user_message:
+        if not self._user_indices:
             return
 
-        self.save_current_session()
+        sd = self._user_indices[-1]
+        last_user_message = self.session_data[sd][CONTENT]
+        self.truncate_session(sd)
+        self.schedule_save()
 
-        self.delete_from_chat_end(to_delete)
+        start = self._user_text_starts[-1] if self._user_text_starts else 0
+        self.delete_from_chat_end(self._display_length - start)
         self.input_box.insert(0, last_user_message)
         self.input_box.focus_set()
         if undo:
             self.input_box.selection_range(0, "end")
 
-    def create_completion_request(
-        self, last_message: str, history: list[dict[str, str]] = []
-    ) -> dict:
+    def add_session_entry(self, entry: dict[str, str]):
         """
-        Creates a completion request for the OpenAI API.
+        Appends an entry to the session data and its role and content to the
+        messages that are sent to the OpenAI API.
+
+        Args:
+            entry (dict[str, str]): The session entry to add.
+        """
+        if entry[ROLE] == USER and entry[CONTENT] != CONTINUE:
+            self._user_indices.append(len(self.session_data))
+        self.session_data.append(entry)
+        self._api_messages.append({ROLE: entry[ROLE], CONTENT: entry[CONTENT]})
+
+    def truncate_session(self, index: int = 0):
+        """
+        Removes the session entries (and the matching API messages) from the
+        given index onwards. By default, it clears the whole session.
+
+        Args:
+            index (int, optional): The index of the first entry to remove. Defaults to 0.
+        """
+        del self.session_data[index:]
+        del self._api_messages[index + 1 :]
+        while self._user_indices and self._user_indices[-1] >= index:
+            self._user_indices.pop()
+        if self._saved_entries is not None and index < self._saved_entries:
+            self._saved_entries = None
+
+    def create_completion_request(self, last_message: str) -> dict:
+        """
+        Creates a completion request for the OpenAI API and adds the last
+        message to the session.
 
         Args:
             last_message (str): The last message from the user.
-            history (list[dict[str, str]], optional): The chat history. Defaults to an empty list.
 
         Returns:
             dict: The completion request.
         """
-        history.append({ROLE: USER, CONTENT: last_message})
+        self.add_session_entry({ROLE: USER, CONTENT: last_message})
+        self._api_messages[0][CONTENT] = self.system_message
         return {
-            "model": "gpt-4o-mini",
-            "messages": [
-                {ROLE: SYSTEM, CONTENT: self.system_message},
-                *[{ROLE: entry[ROLE], CONTENT: entry[CONTENT]} for entry in history],
-            ],
+            "model": self.model,
+            "messages": self._api_messages,
             "max_tokens": self.max_tokens,
         }
 
@@ -573,6 +990,8 @@ class MyPyGPTClient(Tk):
             name (str, optional): The name of the session. Defaults to None.
             keep_session_data (bool, optional): Whether to keep the session data after starting a new session. Defaults to False.
         """
+        self.stop_response(discard=True)
+        self.flush_save()
         if not force_default_personality:
             self.personality = (
                 self.popup_list(
@@ -584,7 +1003,7 @@ class MyPyGPTClient(Tk):
                 or DEFAULT_PERSONALITY
             )
             if self.personality == RANDOM:
-                self.personality = choice(list(PERSONALITIES.keys()))
+                self.personality = choice(PERSONALITY_NAMES)
         else:
             self.personality = DEFAULT_PERSONALITY
         self.current_session = datetime.now().strftime("%Y%m%d%H%M%S")
@@ -593,30 +1012,108 @@ class MyPyGPTClient(Tk):
                 name.lower().replace(" ", "_") + "_" + self.current_session
             )
         if not keep_session_data:
-            self.session_data = []
+            self.truncate_session()
         # self.update_chat_display("New session started!", SYSTEM_NAME)
         self.delete_from_chat_end(all=True)
         self.input_box.focus_set()
 
+    def session_path(self, name: str, extension: str) -> Path:
+        """
+        Returns the path of a session file.
+
+        Args:
+            name (str): The name of the session.
+            extension (str): The extension of the file (one of the `SESSION_*_EXT` constants).
+
+        Returns:
+            Path: The path of the session file.
+        """
+        return self._sessions_path / f"{name}{extension}"
+
+    def session_files(self, name: str) -> list[Path]:
+        """
+        Returns the paths of the existing files of a session.
+
+        Args:
+            name (str): The name of the session.
+
+        Returns:
+            list[Path]: The paths of the existing session files.
+        """
+        return [
+            file_path
+            for extension in [SESSION_META_EXT, SESSION_HISTORY_EXT, SESSION_LEGACY_EXT]
+            if (file_path := self.session_path(name, extension)).exists()
+        ]
+
+    def schedule_save(self):
+        """
+        Saves the current session after `SAVE_DELAY_MS`. Calling it again
+        before that restarts the delay, so bursts of changes result in a
+        single save.
+        """
+        if self._save_pending is not None:
+            self.after_cancel(self._save_pending)
+        self._save_pending = self.after(SAVE_DELAY_MS, self.flush_save)
+
+    def flush_save(self):
+        """
+        Immediately performs the save scheduled by `schedule_save`, if any.
+        This must be called before the current session or its files change.
+        """
+        if self._save_pending is None:
+            return
+        self.after_cancel(self._save_pending)
+        self._save_pending = None
+        self.save_current_session()
+
+    def session_meta(self) -> dict:
+        """
+        Collects the settings of the current session that are saved with it.
+
+        Returns:
+            dict: The settings of the session.
+        """
+        return {
+            "model": self.model,
+            "max_tokens": self.max_tokens,
+            SYSTEM: SYSTEM_MESSAGE,
+            PERSONALITY: self.personality,
+            "add_sys_msg": self.add_sys_msg,
+        }
+
     def save_current_session(self):
         """
-        Saves the current chat session to a file.
-        """
-        if self.current_session and not self.temp_session_var.get():
-            file_path = path.join(self.sessions_dir, f"{self.current_session}.json")
-            with open(file_path, "w") as f:
-                history = self.session_data
-                json_dump(
-                    {
-                        "model": self.model,
-                        "max_tokens": self.max_tokens,
-                        SYSTEM: SYSTEM_MESSAGE,
-                        PERSONALITY: self.personality,
-                        "add_sys_msg": self.add_sys_msg,
-                        "history": history,
-                    },
-                    f,
-                )
+        Saves the current chat session to its files.
+
+        The settings are written into the `SESSION_META_EXT` file only when
+        they have changed. The history is kept in the `SESSION_HISTORY_EXT`
+        file with one entry per line, so usually only the new entries have to
+        be appended to it. It is only rewritten completely if entries were
+        removed since the last save or the session has changed.
+        """
+        if not self.current_session or self.temp_session_var.get():
+            return
+        if self._saved_session != self.current_session:
+            self._saved_session = self.current_session
+            self._saved_meta = None
+            self._saved_entries = None
+
+        meta = self.session_meta()
+        if meta != self._saved_meta:
+            meta_file = self.session_path(self.current_session, SESSION_META_EXT)
+            write_file_safely(meta_file, json_dumps(meta))
+            self._saved_meta = meta
+
+        history_file = self.session_path(self.current_session, SESSION_HISTORY_EXT)
+        if self._saved_entries is None:
+            history = b"".join(map(json_dumps_line, self.session_data))
+            write_file_safely(history_file, history)
+        else:
+            with open(history_file, "ab") as f:
+                entries = self.session_data[self._saved_entries :]
+                f.writelines(map(json_dumps_line, entries))
+        self._saved_entries = len(self.session_data)
 
     def rename_session(self, name: str = None, keep_original: bool = False):
         """
@@ -626,6 +1123,7 @@ class MyPyGPTClient(Tk):
             name (str, optional): The new name for the session. If this is provided, then no popup dialog will show. Defaults to None.
             keep_original (bool, optional): Whether to keep the original session file. Defaults to False.
         """
+        self.flush_save()
         if not self.current_session:
             self.popup_info("Error", "No session to rename.", True)
             return
@@ -638,17 +1136,21 @@ class MyPyGPTClient(Tk):
 
         new_name = new_name.lower().replace(" ", "_")
         new_session_name = f"{new_name}_{self.current_session}"
-        new_session_filename = f"{new_session_name}.json"
-        old_session_file = path.join(self.sessions_dir, f"{self.current_session}.json")
-        new_session_file = path.join(self.sessions_dir, new_session_filename)
 
         try:
-            if keep_original:
-                with open(old_session_file, "r") as original_file:
-                    with open(new_session_file, "w") as new_file:
-                        new_file.write(original_file.read())
-            else:
-                os_rename(old_session_file, new_session_file)
+            session_files = self.session_files(self.current_session)
+            if not session_files:
+                raise FileNotFoundError("session file not found")
+            for old_session_file in session_files:
+                new_session_file = self.session_path(
+                    new_session_name, old_session_file.name[len(self.current_session) :]
+                )
+                if keep_original:
+                    new_session_file.write_bytes(old_session_file.read_bytes())
+                else:
+                    old_session_file.rename(new_session_file)
+            if self._saved_session == self.current_session:
+                self._saved_session = new_session_name
             self.current_session = new_session_name
             self.popup_info("Renamed", "Session renamed successfully.")
         except Exception as e:
@@ -681,6 +1183,8 @@ class MyPyGPTClient(Tk):
         if name:
             session_file = name
         else:
+            from tkinter.filedialog import asksaveasfilename
+
             session_file = asksaveasfilename(
                 initialdir=self.sessions_dir,
                 defaultextension=f".{PTEXT}",
@@ -739,31 +1243,25 @@ class MyPyGPTClient(Tk):
                     role = sd[PERSONALITY] if PERSONALITY in sd else ASSISTANT
                 data.append({ROLE: role, CONTENT: content})
 
-        fout = ""  # formatted output (for non-JSON exports)
+        fout = []  # formatted output parts (for non-JSON exports)
 
         if file_extension == PTEXT:
 
-            def to_line_length(lines: str, length: int) -> str:
+            def to_line_length(lines: list[str], length: int) -> tuple[str, int]:
                 stmp = []
                 maxlength = 0
                 for line in lines:
                     indentation = match(r"^\s*", line).group()
-                    line2 = indentation
-                    words = line.split()
-                    outarr = []
-                    for w in words:
-                        LL2 = len(line2)
-                        L = len(w)
-                        if (LL2 + L + 1) > length:
-                            if maxlength < LL2:
-                                maxlength = LL2
-                            outarr.append(line2)
-                            line2 = f"{indentation}{w}"
-                        else:
-                            line2 += f" {w}" if line2 else w
-                    if maxlength < (LL := len(line2)):
-                        maxlength = LL
-                    stmp.append("\n".join(outarr + [line2]))
+                    wrapped = wrap(
+                        " ".join(line.split()),
+                        width=length,
+                        initial_indent=indentation,
+                        subsequent_indent=indentation,
+                        break_long_words=False,
+                        break_on_hyphens=False,
+                    ) or [indentation]
+                    maxlength = max(maxlength, *map(len, wrapped))
+                    stmp.extend(wrapped)
                 return "\n".join(stmp), maxlength
 
             DEF_LENGTH = 60
@@ -781,13 +1279,13 @@ class MyPyGPTClient(Tk):
                 role = entry[ROLE]
                 lines = entry[CONTENT].split("\n")
                 lines, maxlength = to_line_length(lines, length)
-                fout += lines + "\n"
+                fout.append(lines + "\n")
                 if role == USER:
-                    fout += "-" * maxlength + "\n"
+                    fout.append("-" * maxlength + "\n")
                 elif role == SYSTEM:
                     continue
                 else:
-                    fout += "\n"
+                    fout.append("\n")
         elif file_extension == MARKDOWN:
             for entry in data:
                 role = entry[ROLE]
@@ -797,25 +1295,21 @@ class MyPyGPTClient(Tk):
                         role = "query"
                     else:
                         role = "response"
-                    fout += f"**{role}:** {lines}\n\n"
+                    fout.append(f"**{role}:** {lines}\n\n")
         # TODO: reconsider adding different exporting options' implementations
 
-        with open(session_file, "w", encoding="utf-8") as f:
-            if file_extension == JSON:
-                json_dump(
-                    {
-                        "model": self.model,
-                        "max_tokens": self.max_tokens,
-                        SYSTEM: SYSTEM_MESSAGE,
-                        PERSONALITY: self.personality,
-                        "add_sys_msg": self.add_sys_msg,
-                        "history": self.session_data,
-                    },
-                    f,
-                )
-            else:
-                fout = fout.rstrip() + "\n"
-                f.write(fout)
+        if file_extension == JSON:
+            with open(session_file, "wb") as f:
+                # written entry by entry to avoid serializing the whole
+                # history into a single string
+                meta = json_dumps(self.session_meta())
+                f.write(meta[:-1] + b', "history": [')
+                for i, entry in enumerate(self.session_data):
+                    f.write((b"," if i else b"") + json_dumps(entry))
+                f.write(b"]}")
+        else:
+            with open(session_file, "w", encoding="utf-8") as f:
+                f.write("".join(fout).rstrip() + "\n")
 
         self.popup_okcustom(
             "Exported",
@@ -835,48 +1329,99 @@ class MyPyGPTClient(Tk):
         if name and path.exists(name):
             session_file = name
         else:
+            from tkinter.filedialog import askopenfilename
+
             session_file = askopenfilename(
                 initialdir=self.sessions_dir, filetypes=[("JSON Files", "*.json")]
             )
         if not session_file:
             return
+        self.stop_response(discard=True)
+        self.flush_save()
 
-        session_data = []
-        with open(session_file, "r") as f:
-            data = json_load(f)
+        # the files are read in one go, parsing from memory is much faster
+        # than letting the parser pull the data through many small reads
+        if session_file.endswith(SESSION_META_EXT):
+            session_name = session_file[: -len(SESSION_META_EXT)]
+        else:
+            session_name = path.splitext(session_file)[0]
+            # once a legacy session has been saved again, its split files are
+            # the up-to-date ones
+            if path.exists(f"{session_name}{SESSION_META_EXT}"):
+                session_file = f"{session_name}{SESSION_META_EXT}"
+        if session_file.endswith(SESSION_META_EXT):
+            history_file = Path(f"{session_name}{SESSION_HISTORY_EXT}")
+            session_data = []
+            if history_file.exists():
+                session_data = [
+                    json_loads(line)
+                    for line in history_file.read_bytes().splitlines()
+                    if line.strip()
+                ]
+        else:
+            session_data = None
+        data = json_loads(Path(session_file).read_bytes())
+        if session_data is None:
             session_data = data["history"] if "history" in data else []
-            if "model" in data:
-                self.model = data["model"]
-            if PERSONALITY in data:
-                self.personality = data[PERSONALITY]
-            if "add_sys_msg" in data:
-                self.add_sys_msg = data["add_sys_msg"]
-            if "max_tokens" in data:
-                self.max_tokens = data["max_tokens"]
-
-        self.current_session = path.basename(session_file).replace(".json", "")
+        if "model" in data:
+            self.model = data["model"]
+        if PERSONALITY in data:
+            self.personality = data[PERSONALITY]
+        if "add_sys_msg" in data:
+            self.add_sys_msg = data["add_sys_msg"]
+        if "max_tokens" in data:
+            self.max_tokens = data["max_tokens"]
+
+        self.current_session = path.basename(session_name)
+        self._saved_session = None
         self.delete_from_chat_end(all=True)
 
-        is_continued = False
-        for entry in session_data:
-            add_space = False
-            role = ROLE_MAP[entry[ROLE]]
-
-            if role == ASSISTANT_NAME and is_continued:
-                is_continued = False
-                add_space = True
-                role = None
-            elif role == SYSTEM_NAME:
-                continue
-            if role == USER_NAME and entry[CONTENT] == CONTINUE:
-                is_continued = True
-            else:
-                self.update_chat_display(entry[CONTENT], role, add_space)
-            self.session_data.append(entry)
+        self.truncate_session()
+        self.session_data = [entry for entry in session_data if entry[ROLE] != SYSTEM]
+        self._api_messages.extend(
+            {ROLE: entry[ROLE], CONTENT: entry[CONTENT]} for entry in self.session_data
+        )
+        self._user_indices = [
+            index
+            for index, entry in enumerate(self.session_data)
+            if entry[ROLE] == USER and entry[CONTENT] != CONTINUE
+        ]
+        self._replay_into_display(self.session_data)
 
         if not in_background:
             self.input_box.focus_set()
 
+    def _replay_into_display(self, entries: list[dict[str, str]]):
+        """
+        Displays the given session entries in the chat display, merging the
+        continued responses into the ones they continue.
+
+        Args:
+            entries (list[dict[str, str]]): The session entries, starting with
+                the first one of the session.
+        """
+        is_continued = False
+        messages = []
+        for entry in entries:
+            role, content = entry[ROLE], entry[CONTENT]
+            if role == USER and content == CONTINUE:
+                is_continued = True
+                continue
+            if role == ASSISTANT and is_continued:
+                is_continued = False
+                message = self.format_chat_message(content.strip(), None, True)
+                messages.append((message, None))
+            else:
+                sender = ROLE_MAP[role]
+                message = self.format_chat_message(content.strip(), sender)
+                messages.append((message, sender))
+        if messages:
+            # the session data is already filled, so the first message got the
+            # separating newlines of a later one
+            message, role = messages[0]
+            messages[0] = (message.lstrip("\n"), role)
+        self.display_formatted_messages(messages)
+
     def delete_session(
         self,
         askforconfirmation: bool = True,
@@ -891,6 +1436,7 @@ class MyPyGPTClient(Tk):
             show_success (bool, optional): Whether to show a success message after deleting. Defaults to True.
             keep_session_data (bool, optional): Whether to keep the session data after deleting. Defaults to False.
         """
+        self.flush_save()
         if not self.current_session:
             self.popup_info("Error", "No session to delete.", True)
             return
@@ -906,12 +1452,14 @@ class MyPyGPTClient(Tk):
         if not confirm:
             return
 
-        session_file = path.join(self.sessions_dir, f"{self.current_session}.json")
-        if path.exists(session_file):
-            os_remove(session_file)
+        session_files = self.session_files(self.current_session)
+        if session_files:
+            self.stop_response(discard=True)
+            for session_file in session_files:
+                session_file.unlink()
             self.current_session = None
             if not keep_session_data:
-                self.session_data = []
+                self.truncate_session()
                 self.delete_from_chat_end(all=True)
             if show_success:
                 self.popup_info("Deleted", "Current session deleted successfully.")
@@ -920,7 +1468,7 @@ class MyPyGPTClient(Tk):
                 self.popup_info("Error", "Session file not found.", True)
         self.input_box.focus_set()
 
-    def center_window(self, target):
+    def center_window(self, target, layout: tuple | None = None):
         """
         A function to place windows at the center of their parent or the
         screen. If the `target` does not equal `self`, then the target window
@@ -934,10 +1482,22 @@ class MyPyGPTClient(Tk):
         Alternatively I could have used `self.evan(f'tk::placeWindow
         {str(target)} center')` probably.
 
+        The target should be withdrawn before its widgets are added, so that it
+        is only laid out once, right here.
+
         Args:
             target: The window to center.
+            layout (tuple | None, optional): Describes everything the size and
+                position of the window depend on. If it matches the one of the
+                previous call, the previous position is reused without laying
+                out the window again. Defaults to None.
         """
-        target.wm_withdraw()
+        cached = getattr(target, "_cached_geometry", None)
+        if layout is not None and cached and cached[0] == layout:
+            target.wm_geometry(cached[1])
+            target.deiconify()
+            return
+
         target.update_idletasks()
         minwidth, maxwidth = target.winfo_reqwidth(), target.winfo_vrootwidth()
         minheight, maxheight = target.winfo_reqheight(), target.winfo_vrootheight()
@@ -954,6 +1514,85 @@ class MyPyGPTClient(Tk):
         target.wm_maxsize(maxwidth, maxheight)
         target.wm_geometry(f"+{x}+{y}")
         target.deiconify()
+        if layout is not None:
+            target._cached_geometry = (layout, f"+{x}+{y}")
+
+    def get_popup(self, kind: str, build) -> dict:
+        """
+        Returns the cached popup window of the given kind. The window is only
+        built on first use, afterwards it is hidden instead of destroyed and
+        reused. While the cached one is open, a throw-away popup is built
+        instead, so popups of the same kind can be open at the same time.
+
+        Args:
+            kind (str): The kind of the popup, used as the key in the cache.
+            build: A function that fills the popup's hidden window with its
+                widgets and stores the ones needed later in the popup.
+
+        Returns:
+            dict: The popup, holding its "window", the "closed" variable and
+                whatever `build` stored in it.
+        """
+        popup = self._popup_cache.get(kind)
+        if popup is not None and not popup["busy"]:
+            popup["busy"] = True
+            return popup
+
+        window = Toplevel(self)
+        window.wm_withdraw()
+        window.resizable(False, False)
+        window.transient(self)
+        popup = {
+            "window": window,
+            "closed": BooleanVar(window),
+            "busy": True,
+            "cached": kind not in self._popup_cache,
+        }
+        window.protocol("WM_DELETE_WINDOW", lambda: self.hide_popup(popup))
+        build(popup)
+        if popup["cached"]:
+            self._popup_cache[kind] = popup
+        return popup
+
+    def show_popup(self, popup: dict, title: str, icon: str, focus):
+        """
+        Shows a popup and waits until it is hidden again. Afterwards the popup
+        can be reused, or it is destroyed if it was a throw-away one.
+
+        Args:
+            popup (dict): The popup returned by `get_popup`.
+            title (str): The title of the popup window.
+            icon (str): The name of the icon of the popup window.
+            focus: The widget to focus once the popup is shown.
+        """
+        window = popup["window"]
+        window.title(title)
+        window.iconbitmap(f"{ICONS_DIR}/{icon}")
+        window.grab_set()
+        # the popups are not resizable, so only the texts on them and the
+        # position of the main window decide where they end up
+        layout = (self.wm_geometry(),) + tuple(
+            widget.cget("text")
+            for widget in popup.values()
+            if isinstance(widget, (Label, Button))
+        )
+        self.center_window(window, layout)
+        focus.focus_set()
+        window.wait_variable(popup["closed"])
+        popup["busy"] = False
+        if not popup["cached"]:
+            window.destroy()
+
+    def hide_popup(self, popup: dict):
+        """
+        Hides a popup shown by `show_popup`, keeping it for later use.
+
+        Args:
+            popup (dict): The popup to hide.
+        """
+        popup["window"].grab_release()
+        popup["window"].wm_withdraw()
+        popup["closed"].set(True)
 
     def popup_info(self, title: str, message: str, error: bool = False):
         """
@@ -964,23 +1603,23 @@ class MyPyGPTClient(Tk):
             message (str): The message to display in the popup window.
             error (bool, optional): Whether to display an error icon. Defaults to False.
         """
-        info_window = Toplevel(self)
-        info_window.title(title)
-        info_window.resizable(False, False)
-        info_window.iconbitmap(f"{ICONS_DIR}/" + (Icons.ERROR if error else Icons.INFO))
 
-        Label(info_window, text=message, wraplength=280).pack(padx=20, pady=10)
+        def build(popup):
+            window = popup["window"]
+            popup["label"] = Label(window, wraplength=280)
+            popup["label"].pack(padx=20, pady=10)
 
-        ok_button = Button(info_window, text="OK", command=info_window.destroy)
-        ok_button.bind("<Return>", lambda e: e.widget.invoke())
-        ok_button.bind("<Escape>", lambda e: e.widget.invoke())
-        ok_button.pack(pady=10)
+            ok_button = Button(
+                window, text="OK", command=lambda: self.hide_popup(popup)
+            )
+            ok_button.bind("<Return>", lambda e: e.widget.invoke())
+            ok_button.bind("<Escape>", lambda e: e.widget.invoke())
+            ok_button.pack(pady=10)
+            popup["ok"] = ok_button
 
-        info_window.transient(self)
-        info_window.grab_set()
-        self.center_window(info_window)
-        ok_button.focus_set()
-        self.wait_window(info_window)
+        popup = self.get_popup("info", build)
+        popup["label"].configure(text=message)
+        self.show_popup(popup, title, Icons.ERROR if error else Icons.INFO, popup["ok"])
 
     def popup_yesno(
         self, title: str, message: str, yes: str = "Yes", no: str = "No"
@@ -997,79 +1636,82 @@ class MyPyGPTClient(Tk):
         Returns:
             bool: True if the user clicked yes, False otherwise.
         """
-        popup = Toplevel(self)
-        popup.title(title)
-        popup.resizable(False, False)
-        popup.iconbitmap(f"{ICONS_DIR}/{Icons.ASK}")
 
-        Label(popup, text=message, wraplength=280).pack(padx=20, pady=10)
+        def build(popup):
+            window = popup["window"]
+            popup["label"] = Label(window, wraplength=280)
+            popup["label"].pack(padx=20, pady=10)
 
-        button_frame = Frame(popup)
-        button_frame.pack(pady=10)
+            button_frame = Frame(window)
+            button_frame.pack(pady=10)
 
-        result = BooleanVar(popup, value=False)
+            result = popup["result"] = BooleanVar(window, value=False)
 
-        def on_yes():
-            result.set(True)
-            popup.destroy()
+            def on_yes():
+                result.set(True)
+                self.hide_popup(popup)
 
-        def on_no():
-            result.set(False)
-            popup.destroy()
+            def on_no():
+                result.set(False)
+                self.hide_popup(popup)
 
-        yes_button = Button(button_frame, text=yes, command=on_yes)
-        yes_button.bind("<Return>", lambda e: e.widget.invoke())
-        yes_button.bind("<Escape>", lambda e: on_no())
-        yes_button.pack(side="left", padx=10)
+            yes_button = Button(button_frame, command=on_yes)
+            yes_button.bind("<Return>", lambda e: e.widget.invoke())
+            yes_button.bind("<Escape>", lambda e: on_no())
+            yes_button.pack(side="left", padx=10)
+            popup["yes"] = yes_button
 
-        no_button = Button(button_frame, text=no, command=on_no)
-        no_button.bind("<Return>", lambda e: e.widget.invoke())
-        no_button.bind("<Escape>", lambda e: on_no())
-        no_button.pack(side="right", padx=10)
+            no_button = Button(button_frame, command=on_no)
+            no_button.bind("<Return>", lambda e: e.widget.invoke())
+            no_button.bind("<Escape>", lambda e: on_no())
+            no_button.pack(side="right", padx=10)
+            popup["no"] = no_button
 
-        popup.transient(self)
-        popup.grab_set()
-        self.center_window(popup)
-        yes_button.focus_set()
-        self.wait_window(popup)
+        popup = self.get_popup("yesno", build)
+        popup["label"].configure(text=message)
+        popup["yes"].configure(text=yes)
+        popup["no"].configure(text=no)
+        popup["result"].set(False)
+        self.show_popup(popup, title, Icons.ASK, popup["yes"])
 
-        return result.get()
+        return popup["result"].get()
 
     def popup_okcustom(
         self, title: str, message: str, custom: str, custom_callback, ok: str = "Ok"
     ) -> bool:
-        popup = Toplevel(self)
-        popup.title(title)
-        popup.resizable(False, False)
-        popup.iconbitmap(f"{ICONS_DIR}/{Icons.DEFAULT}")
-
-        Label(popup, text=message, wraplength=280).pack(padx=20, pady=10)
-
-        button_frame = Frame(popup)
-        button_frame.pack(pady=10)
-
-        def on_ok():
-            popup.destroy()
-
-        def on_custom():
-            custom_callback()
-            popup.destroy()
-
-        ok_button = Button(button_frame, text=ok, command=on_ok)
-        ok_button.bind("<Return>", lambda e: e.widget.invoke())
-        ok_button.bind("<Escape>", lambda e: on_ok())
-        ok_button.pack(side="left", padx=10)
-
-        custom_button = Button(button_frame, text=custom, command=on_custom)
-        custom_button.bind("<Return>", lambda e: e.widget.invoke())
-        custom_button.bind("<Escape>", lambda e: on_ok())
-        custom_button.pack(side="right", padx=10)
-
-        popup.transient(self)
-        popup.grab_set()
-        self.center_window(popup)
-        ok_button.focus_set()
-        self.wait_window(popup)
+        def build(popup):
+            window = popup["window"]
+            popup["label"] = Label(window, wraplength=280)
+            popup["label"].pack(padx=20, pady=10)
+
+            button_frame = Frame(window)
+            button_frame.pack(pady=10)
+
+            def on_ok():
+                self.hide_popup(popup)
+
+            ok_button = Button(button_frame, command=on_ok)
+            ok_button.bind("<Return>", lambda e: e.widget.invoke())
+            ok_button.bind("<Escape>", lambda e: on_ok())
+            ok_button.pack(side="left", padx=10)
+            popup["ok"] = ok_button
+
+            def on_custom():
+                popup["custom_callback"]()
+                self.hide_popup(popup)
+
+            custom_button = Button(button_frame, command=on_custom)
+            custom_button.bind("<Return>", lambda e: e.widget.invoke())
+            custom_button.bind("<Escape>", lambda e: on_ok())
+            custom_button.pack(side="right", padx=10)
+            popup["custom"] = custom_button
+
+        popup = self.get_popup("okcustom", build)
+        popup["label"].configure(text=message)
+        popup["ok"].configure(text=ok)
+        popup["custom"].configure(text=custom)
+        popup["custom_callback"] = custom_callback
+        self.show_popup(popup, title, Icons.DEFAULT, popup["ok"])
 
     def popup_integer(
         self,
@@ -1092,57 +1734,57 @@ class MyPyGPTClient(Tk):
         Returns:
             int: The integer input from the user.
         """
-        result = IntVar(value=initialvalue)
-
-        popup = Toplevel(self)
-        popup.title(title)
-        popup.resizable(False, False)
-        popup.iconbitmap(f"{ICONS_DIR}/{Icons.ASK}")
-
-        Label(popup, text=prompt, wraplength=280).pack(padx=20, pady=10)
-
-        entry = Entry(popup, textvariable=result)
-        entry.pack(padx=20, pady=10)
-        entry.focus_set()
 
-        def on_ok():
-            try:
-                value = int(entry.get())
-                if (minvalue is not None and value < minvalue) or (
-                    maxvalue is not None and value > maxvalue
-                ):
-                    raise ValueError
-                result.set(value)
-                popup.destroy()
-            except ValueError:
-                entry.delete(0, "end")
-                entry.insert(0, initialvalue if initialvalue is not None else "")
-
-        def on_cancel():
-            result.set(None)
-            popup.destroy()
-
-        button_frame = Frame(popup)
-        button_frame.pack(pady=10)
-
-        entry.bind("<Return>", lambda e: on_ok())
-
-        ok_button = Button(button_frame, text="OK", command=on_ok)
-        ok_button.bind("<Return>", lambda e: e.widget.invoke())
-        ok_button.bind("<Escape>", lambda e: on_cancel())
-        ok_button.pack(side="left", padx=10)
-
-        cancel_button = Button(button_frame, text="Cancel", command=on_cancel)
-        cancel_button.bind("<Return>", lambda e: e.widget.invoke())
-        cancel_button.bind("<Escape>", lambda e: on_cancel())
-        cancel_button.pack(side="right", padx=10)
-
-        popup.transient(self)
-        popup.grab_set()
-        self.center_window(popup)
-        self.wait_window(popup)
-
-        return result.get()
+        def build(popup):
+            window = popup["window"]
+            popup["label"] = Label(window, wraplength=280)
+            popup["label"].pack(padx=20, pady=10)
+
+            result = popup["result"] = IntVar(window)
+            entry = popup["entry"] = Entry(window, textvariable=result)
+            entry.pack(padx=20, pady=10)
+
+            def on_ok():
+                minvalue, maxvalue, initialvalue = popup["limits"]
+                try:
+                    value = int(entry.get())
+                    if (minvalue is not None and value < minvalue) or (
+                        maxvalue is not None and value > maxvalue
+                    ):
+                        raise ValueError
+                    result.set(value)
+                    self.hide_popup(popup)
+                except ValueError:
+                    entry.delete(0, "end")
+                    entry.insert(0, initialvalue if initialvalue is not None else "")
+
+            def on_cancel():
+                result.set(None)
+                self.hide_popup(popup)
+
+            button_frame = Frame(window)
+            button_frame.pack(pady=10)
+
+            entry.bind("<Return>", lambda e: on_ok())
+
+            ok_button = Button(button_frame, text="OK", command=on_ok)
+            ok_button.bind("<Return>", lambda e: e.widget.invoke())
+            ok_button.bind("<Escape>", lambda e: on_cancel())
+            ok_button.pack(side="left", padx=10)
+            popup["ok"] = ok_button
+
+            cancel_button = Button(button_frame, text="Cancel", command=on_cancel)
+            cancel_button.bind("<Return>", lambda e: e.widget.invoke())
+            cancel_button.bind("<Escape>", lambda e: on_cancel())
+            cancel_button.pack(side="right", padx=10)
+
+        popup = self.get_popup("integer", build)
+        popup["label"].configure(text=prompt)
+        popup["limits"] = (minvalue, maxvalue, initialvalue)
+        popup["result"].set(initialvalue if initialvalue is not None else 0)
+        self.show_popup(popup, title, Icons.ASK, popup["entry"])
+
+        return popup["result"].get()
 
     def popup_string(self, title: str, prompt: str, initialvalue: str = "") -> str:
         """
@@ -1156,47 +1798,44 @@ class MyPyGPTClient(Tk):
         Returns:
             str: The string input from the user.
         """
-        result = StringVar(value=initialvalue)
-
-        popup = Toplevel(self)
-        popup.title(title)
-        popup.resizable(False, False)
-        popup.iconbitmap(f"{ICONS_DIR}/{Icons.ASK}")
 
-        Label(popup, text=prompt, wraplength=280).pack(padx=20, pady=10)
+        def build(popup):
+            window = popup["window"]
+            popup["label"] = Label(window, wraplength=280)
+            popup["label"].pack(padx=20, pady=10)
 
-        entry = Entry(popup, textvariable=result)
-        entry.pack(padx=20, pady=10)
-        entry.focus_set()
+            result = popup["result"] = StringVar(window)
+            popup["entry"] = Entry(window, textvariable=result)
+            popup["entry"].pack(padx=20, pady=10)
 
-        def on_ok():
-            popup.destroy()
+            def on_ok():
+                self.hide_popup(popup)
 
-        def on_cancel():
-            result.set(None)
-            popup.destroy()
+            def on_cancel():
+                result.set(None)
+                self.hide_popup(popup)
 
-        button_frame = Frame(popup)
-        button_frame.pack(pady=10)
+            button_frame = Frame(window)
+            button_frame.pack(pady=10)
 
-        entry.bind("<Return>", lambda e: on_ok())
+            popup["entry"].bind("<Return>", lambda e: on_ok())
 
-        ok_button = Button(button_frame, text="OK", command=on_ok)
-        ok_button.bind("<Return>", lambda e: e.widget.invoke())
-        ok_button.bind("<Escape>", lambda e: on_cancel())
-        ok_button.pack(side="left", padx=10)
+            ok_button = Button(button_frame, text="OK", command=on_ok)
+            ok_button.bind("<Return>", lambda e: e.widget.invoke())
+            ok_button.bind("<Escape>", lambda e: on_cancel())
+            ok_button.pack(side="left", padx=10)
 
-        cancel_button = Button(button_frame, text="Cancel", command=on_cancel)
-        cancel_button.bind("<Return>", lambda e: e.widget.invoke())
-        cancel_button.bind("<Escape>", lambda e: on_cancel())
-        cancel_button.pack(side="right", padx=10)
+            cancel_button = Button(button_frame, text="Cancel", command=on_cancel)
+            cancel_button.bind("<Return>", lambda e: e.widget.invoke())
+            cancel_button.bind("<Escape>", lambda e: on_cancel())
+            cancel_button.pack(side="right", padx=10)
 
-        popup.transient(self)
-        popup.grab_set()
-        self.center_window(popup)
-        self.wait_window(popup)
+        popup = self.get_popup("string", build)
+        popup["label"].configure(text=prompt)
+        popup["result"].set(initialvalue)
+        self.show_popup(popup, title, Icons.ASK, popup["entry"])
 
-        return result.get()
+        return popup["result"].get()
 
     def popup_list(
         self,
@@ -1217,77 +1856,77 @@ class MyPyGPTClient(Tk):
         Returns:
             str: The selected option.
         """
-        result = StringVar(value="")
 
-        popup = Toplevel(self)
-        popup.title(title)
-        popup.configure(width=480)
-        popup.resizable(False, False)
-        popup.iconbitmap(f"{ICONS_DIR}/{Icons.ASK}")
+        def build(popup):
+            window = popup["window"]
+            window.configure(width=480)
+            popup["label"] = Label(window, wraplength=280)
+            popup["label"].pack(padx=20, pady=10)
 
-        Label(popup, text=message, wraplength=280).pack(padx=20, pady=10)
+            list_frame = Frame(window)
+            list_frame.pack(pady=10, padx=10, fill="x")
 
-        list_frame = Frame(popup)
-        list_frame.pack(pady=10, padx=10, fill="x")
+            option_list = Listbox(list_frame, height=10, selectmode="single")
+            option_list.pack(side="left", fill="y")
+            popup["list"] = option_list
 
-        option_list = Listbox(list_frame, height=10, selectmode="single")
-        for option in options:
-            option_list.insert("end", option)
-        option_list.pack(side="left", fill="y")
+            detail_frame = Frame(list_frame)
+            detail_frame.pack(side="left", padx=10, fill="both", expand=True)
 
-        detail_frame = Frame(list_frame)
-        detail_frame.pack(side="left", padx=10, fill="both", expand=True)
+            detail_label = Text(detail_frame, wrap="word", height=10, state="disabled")
+            detail_label.pack(side="left", fill="both", expand=True)
 
-        detail_label = Text(detail_frame, wrap="word", height=10, state="disabled")
-        detail_label.pack(side="left", fill="both", expand=True)
+            scrollbar = Scrollbar(detail_frame, command=detail_label.yview)
+            scrollbar.pack(side="right", fill="y")
+            detail_label.config(yscrollcommand=scrollbar.set)
 
-        scrollbar = Scrollbar(detail_frame, command=detail_label.yview)
-        scrollbar.pack(side="right", fill="y")
-        detail_label.config(yscrollcommand=scrollbar.set)
+            result = popup["result"] = StringVar(window, value="")
 
-        def on_select():
-            detail_label.config(state="normal")
-            detail_label.delete(1.0, "end")
-            detail_label.insert(
-                "end", options[option_list.get(option_list.curselection())]
-            )
-            detail_label.config(state="disabled")
-
-        def on_option():
-            result.set(option_list.get(option_list.curselection()))
-            popup.destroy()
-
-        def on_cancel():
-            result.set(option_list.get("end"))
-            popup.destroy()
-
-        option_list.bind("<<ListboxSelect>>", lambda e: on_select())
-        option_list.bind("<Return>", lambda e: on_option())
-        option_list.bind("<Escape>", lambda e: on_cancel())
-
-        button_frame = Frame(popup)
-        button_frame.pack(pady=10)
-
-        select_button = Button(button_frame, text="Select", command=on_option)
-        select_button.bind("<Return>", lambda e: e.widget.invoke())
-        select_button.bind("<Escape>", lambda e: on_cancel())
-        select_button.pack(padx=10)
-
-        popup.transient(self)
-        popup.grab_set()
-        self.center_window(popup)
-        option_list.focus_set()
-        index = (
-            list(options.keys()).index(default)
-            if default and default in options
-            else "end"
+            def on_select():
+                detail_label.config(state="normal")
+                detail_label.delete(1.0, "end")
+                detail_label.insert(
+                    "end", popup["options"][option_list.get(option_list.curselection())]
+                )
+                detail_label.config(state="disabled")
+
+            def on_option():
+                result.set(option_list.get(option_list.curselection()))
+                self.hide_popup(popup)
+
+            def on_cancel():
+                result.set(option_list.get("end"))
+                self.hide_popup(popup)
+
+            popup["select"] = on_select
+            option_list.bind("<<ListboxSelect>>", lambda e: on_select())
+            option_list.bind("<Return>", lambda e: on_option())
+            option_list.bind("<Escape>", lambda e: on_cancel())
+
+            button_frame = Frame(window)
+            button_frame.pack(pady=10)
+
+            select_button = Button(button_frame, text="Select", command=on_option)
+            select_button.bind("<Return>", lambda e: e.widget.invoke())
+            select_button.bind("<Escape>", lambda e: on_cancel())
+            select_button.pack(padx=10)
+
+        popup = self.get_popup("list", build)
+        popup["label"].configure(text=message)
+        popup["options"] = options
+        popup["result"].set("")
+        option_list = popup["list"]
+        option_list.delete(0, "end")
+        option_list.insert("end", *options)
+        index = next(
+            (i for i, option in enumerate(options) if option == default), "end"
         )
         option_list.select_set(index)
         option_list.see(index)
-        on_select()
-        self.wait_window(popup)
+        popup["select"]()
+        self.show_popup(popup, title, Icons.ASK, option_list)
 
-        return result.get()
+        return popup["result"].get()
 
     def get_models(self):
         """
@@ -1298,7 +1937,7 @@ class MyPyGPTClient(Tk):
         try:
             response = requests_get(
                 "https://api.openai.com/v1/models",
-                headers={"Authorization": f"Bearer {openai.api_key}"},
+                headers={"Authorization": f"Bearer {self.openai_client.api_key}"},
             )
             response.raise_for_status()
             models = response.json().get("data", [])
@@ -1310,7 +1949,10 @@ class MyPyGPTClient(Tk):
         """
         Displays a window to edit the system message and other settings.
         """
+        from tkinter.ttk import Combobox
+
         edit_window = Toplevel(self)
+        edit_window.wm_withdraw()
         edit_window.title("Edit System Message")
         edit_window.resizable(False, False)
         edit_window.iconbitmap(f"{ICONS_DIR}/{Icons.DEFAULT}")
@@ -1337,7 +1979,7 @@ class MyPyGPTClient(Tk):
         personality_combobox = Combobox(
             personality_frame,
             textvariable=personality_var,
-            values=list(PERSONALITIES.keys()),
+            values=PERSONALITY_NAMES,
             state="readonly",
         )
         personality_combobox.pack(side="right", fill="x", expand=True, padx=10)
@@ -1435,12 +2077,10 @@ class MyPyGPTClient(Tk):
             self.popup_info("Error", "Folder does not exist.", True)
             return
 
-        sysname = systemname().casefold()
-
-        if sysname == "windows":
+        if IS_WINDOWS:
             # Popen(f'explorer "{folder}"')
             startfile(path.normpath(folder), "open")
-        elif sysname == "darwin":
+        elif IS_DARWIN:
             Popen(["open", folder])
         else:
             try:
@@ -1454,12 +2094,5 @@ class MyPyGPTClient(Tk):
 
 
 if __name__ == "__main__":
-    try:
-        openai = OpenAI()
-    except OpenAIError as e:
-        from tkinter.messagebox import showerror
-
-        showerror("OpenAI Error", f"An error occurred while initializing OpenAI: {e}")
-        exit(1)
     app = MyPyGPTClient()
     app.mainloop()